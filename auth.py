@@ -1,32 +1,224 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
+import bcrypt
+import jwt
+from argon2 import PasswordHasher, Type
+from argon2.low_level import ARGON2_VERSION
+from argon2.exceptions import InvalidHashError, VerificationError
+from jwt.utils import base64url_decode
+from cachetools import TTLCache
+from datetime import timedelta
 from decouple import config
 from fastapi import HTTPException, status
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import hashlib
+import hmac
+import json
 import logging
+import multiprocessing
+import ssl
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-# Password hashing configuration
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing configuration (argon2id, OWASP 46 MiB / t=1 / p=1 profile)
+ARGON2_TIME_COST = config('ARGON2_TIME_COST', default=1, cast=int)
+ARGON2_MEMORY_COST_KIB = config('ARGON2_MEMORY_COST_KIB', default=46 * 1024, cast=int)
+ARGON2_PARALLELISM = config('ARGON2_PARALLELISM', default=1, cast=int)
+ARGON2_HASH_LEN = config('ARGON2_HASH_LEN', default=32, cast=int)
+
+password_hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST_KIB,
+    parallelism=ARGON2_PARALLELISM,
+    hash_len=ARGON2_HASH_LEN,
+    type=Type.ID
+)
+
+# Every hash made with the parameters above has this exact shape, so
+# needs_rehash can compare strings instead of parsing the PHC parameters
+_CURRENT_HASH_PREFIX = (
+    f"$argon2id$v={ARGON2_VERSION}"
+    f"$m={ARGON2_MEMORY_COST_KIB},t={ARGON2_TIME_COST},p={ARGON2_PARALLELISM}$"
+)
+# Unpadded base64 lengths of the salt and digest fields
+_CURRENT_SALT_B64_LEN = (4 * password_hasher.salt_len + 2) // 3
+_CURRENT_HASH_B64_LEN = (4 * password_hasher.hash_len + 2) // 3
+
+# Hashes run in worker processes so logins hash in parallel across cores.
+# The pool is per uvicorn worker: size it to CPU cores / --workers
+HASH_POOL_WORKERS = config('HASH_POOL_WORKERS', default=1, cast=int)
+
+_hash_pool = None
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    """Get the password hashing process pool, creating it on first use"""
+    global _hash_pool
+    if _hash_pool is None:
+        # spawn: forking a process that already runs threads is unsafe
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=HASH_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _hash_pool
+
+async def _run_in_hash_pool(func, *args):
+    """Run func(*args) in the hashing pool, replacing the pool once if it broke"""
+    global _hash_pool
+    loop = asyncio.get_running_loop()
+    pool = _get_hash_pool()
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed mid-hash); a broken pool never
+        # recovers, so start a fresh one unless another call already did
+        logger.warning("Password hashing pool broke; starting a new one")
+        if _hash_pool is pool:
+            _hash_pool = None
+            pool.shutdown(wait=False)
+        return await loop.run_in_executor(_get_hash_pool(), func, *args)
+
+def shutdown_hash_pool():
+    """Stop the password hashing worker processes"""
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown()
+        _hash_pool = None
+
+# Legacy bcrypt hashes are still accepted and upgraded on the next login.
+# bcrypt only looks at the first 72 bytes of the password
+BCRYPT_MAX_PASSWORD_BYTES = 72
 
 # JWT configuration
 SECRET_KEY = config('SECRET_KEY', default='your-secret-key-change-this-in-production')
 ALGORITHM = config('ALGORITHM', default='HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = config('ACCESS_TOKEN_EXPIRE_MINUTES', default=30, cast=int)
 
+# Built once rather than on every encode/decode call
+_DEFAULT_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+_ALGORITHMS = [ALGORITHM]
+_DECODE_OPTIONS = {"require": ["exp", "sub"]}
+
+# Verified token cache configuration (never longer than a token's lifetime)
+TOKEN_CACHE_SIZE = config('TOKEN_CACHE_SIZE', default=10000, cast=int)
+TOKEN_CACHE_TTL_SECONDS = min(
+    config('TOKEN_CACHE_TTL_SECONDS', default=60, cast=int),
+    ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+
+# Header segment of every token this service mints. When a token carries
+# exactly this header its alg is already known, so HS256 tokens can be
+# verified without decoding the header.
+_SECRET_KEY_BYTES = SECRET_KEY.encode()
+_ISSUED_TOKEN_HEADER = (
+    jwt.encode({}, SECRET_KEY, algorithm=ALGORITHM).split(".", 1)[0]
+    if ALGORITHM == "HS256" else None
+)
+# The only claims create_access_token emits; any other claim (jti, nbf,
+# iat, aud, iss, ...) may need PyJWT's validation, so it takes the slow path
+_FAST_PATH_CLAIMS = frozenset(("sub", "exp"))
+
+def _decode_issued_token(token: str) -> Optional[dict]:
+    """Verify an HS256 token minted by this service, skipping the header parse.
+    
+    Returns the payload only for a fully valid token; anything unusual returns
+    None so the caller falls back to jwt.decode for the authoritative result.
+    """
+    if _ISSUED_TOKEN_HEADER is None or token.count(".") != 2:
+        return None
+    
+    signing_input, _, signature = token.rpartition(".")
+    header, _, encoded_payload = signing_input.partition(".")
+    if header != _ISSUED_TOKEN_HEADER:
+        return None
+    
+    try:
+        expected = hmac.new(_SECRET_KEY_BYTES, signing_input.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64url_decode(signature)):
+            return None
+        payload = json.loads(base64url_decode(encoded_payload))
+    except ValueError:
+        return None
+    
+    if not isinstance(payload, dict) or payload.keys() != _FAST_PATH_CLAIMS:
+        return None
+    
+    # create_access_token always writes exp as a plain int
+    expire = payload["exp"]
+    if type(expire) is not int or expire <= time.time():
+        return None
+    if not isinstance(payload.get("sub"), str):
+        return None
+    
+    return payload
+
+def log_crypto_backend():
+    """Log the OpenSSL build that backs HMAC-SHA256 for JWT signing"""
+    # hashlib/hmac dispatch to OpenSSL, which only uses the SHA extensions
+    # (SHA-NI) from 1.1.1 onwards
+    if ssl.OPENSSL_VERSION_INFO < (1, 1, 1):
+        logger.warning(
+            f"{ssl.OPENSSL_VERSION} predates 1.1.1; HMAC-SHA256 will not use SHA-NI"
+        )
+    else:
+        logger.info(f"HMAC-SHA256 backed by {ssl.OPENSSL_VERSION}")
+
 class AuthManager:
     """Class to handle authentication operations"""
     
+    # Tokens are immutable until they expire, so decoded results can be reused
+    _token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+    _token_cache_lock = threading.Lock()
+    
     @staticmethod
     def hash_password(password: str) -> str:
-        """Hash a password using bcrypt"""
-        return pwd_context.hash(password)
+        """Hash a password using argon2id"""
+        return password_hasher.hash(password)
     
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+        """Verify a password against its argon2 or legacy bcrypt hash"""
+        try:
+            if hashed_password.startswith("$argon2"):
+                return password_hasher.verify(hashed_password, plain_password)
+            
+            return bcrypt.checkpw(
+                plain_password.encode()[:BCRYPT_MAX_PASSWORD_BYTES],
+                hashed_password.encode()
+            )
+        except VerificationError:
+            return False
+        except (InvalidHashError, ValueError) as e:
+            # Malformed or unsupported hash stored for this user
+            logger.error(f"Password hash verification error: {e}")
+            return False
+    
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        """Hash a password in the hashing process pool"""
+        return await _run_in_hash_pool(AuthManager.hash_password, password)
+    
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """Verify a password in the hashing process pool"""
+        return await _run_in_hash_pool(AuthManager.verify_password, plain_password, hashed_password)
+    
+    @staticmethod
+    def needs_rehash(hashed_password: str) -> bool:
+        """Check whether a stored hash uses an outdated scheme or parameters"""
+        if hashed_password.startswith(_CURRENT_HASH_PREFIX):
+            salt, _, digest = hashed_password[len(_CURRENT_HASH_PREFIX):].partition("$")
+            if len(salt) == _CURRENT_SALT_B64_LEN and len(digest) == _CURRENT_HASH_B64_LEN:
+                return False
+        
+        if not hashed_password.startswith("$argon2"):
+            return True
+        try:
+            return password_hasher.check_needs_rehash(hashed_password)
+        except InvalidHashError:
+            return True
     
     @staticmethod
     def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
@@ -34,31 +226,48 @@ class AuthManager:
         to_encode = data.copy()
         
         if expires_delta:
-            expire = datetime.utcnow() + expires_delta
+            expire_seconds = expires_delta.total_seconds()
         else:
-            expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            expire_seconds = _DEFAULT_EXPIRE_SECONDS
         
-        to_encode.update({"exp": expire})
+        # exp as integer epoch seconds, no datetime conversion needed
+        to_encode["exp"] = int(time.time() + expire_seconds)
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
         return encoded_jwt
     
-    @staticmethod
-    def verify_token(token: str) -> dict:
+    @classmethod
+    def verify_token(cls, token: str) -> dict:
         """Verify and decode a JWT token"""
+        cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        
+        with cls._token_cache_lock:
+            cached = cls._token_cache.get(cache_key)
+        
+        if cached is not None:
+            token_data, expire = cached
+            if expire > time.time():
+                return dict(token_data)
+        
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username: str = payload.get("sub")
-            
-            if username is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid authentication credentials",
-                    headers={"WWW-Authenticate": "Bearer"},
+            payload = _decode_issued_token(token)
+            if payload is None:
+                # Missing exp/sub claims are rejected by PyJWT itself
+                payload = jwt.decode(
+                    token,
+                    SECRET_KEY,
+                    algorithms=_ALGORITHMS,
+                    options=_DECODE_OPTIONS
                 )
             
-            return {"username": username}
+            token_data = {"username": payload["sub"]}
+            with cls._token_cache_lock:
+                cls._token_cache[cache_key] = (token_data, payload["exp"])
             
-        except JWTError as e:
+            return dict(token_data)
+            
+        except jwt.InvalidTokenError as e:
+            with cls._token_cache_lock:
+                cls._token_cache.pop(cache_key, None)
             logger.error(f"JWT verification error: {e}")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -67,4 +276,11 @@ class AuthManager:
             )
 
 # Create auth manager instance
-auth_manager = AuthManager()
\ No newline at end of file
+auth_manager = AuthManager()
+
+def warm_up():
+    """Run each hashing and token code path once so the first request doesn't pay for it"""
+    hashed = auth_manager.hash_password("warmup")
+    auth_manager.verify_password("warmup", hashed)
+    token = auth_manager.create_access_token({"sub": "warmup"})
+    auth_manager.verify_token(token)
\ No newline at end of file
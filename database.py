@@ -1,6 +1,6 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import asyncpg
 from decouple import config
+import asyncio
 import logging
 
 # Configure logging
@@ -16,53 +16,47 @@ DB_CONFIG = {
     'password': config('DB_PASSWORD')
 }
 
-class DatabaseConnection:
-    def __init__(self):
-        self.connection = None
+# Connection pool configuration
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=5, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=50, cast=int)
+# Prepared statements cached per connection (asyncpg's default is 100)
+DB_STATEMENT_CACHE_SIZE = config('DB_STATEMENT_CACHE_SIZE', default=1024, cast=int)
+
+class Record(asyncpg.Record):
+    """Row whose columns are also attributes, so models with
+    from_attributes=True validate it directly instead of via dict(row)"""
     
-    def connect(self):
-        """Establish database connection"""
+    def __getattr__(self, name):
         try:
-            self.connection = psycopg2.connect(**DB_CONFIG)
-            self.connection.autocommit = False
-            logger.info("Database connection established successfully")
-            return self.connection
-        except psycopg2.Error as e:
-            logger.error(f"Error connecting to PostgreSQL database: {e}")
-            raise
-    
-    def disconnect(self):
-        """Close database connection"""
-        if self.connection:
-            self.connection.close()
-            logger.info("Database connection closed")
-    
-    def get_cursor(self):
-        """Get database cursor with RealDictCursor for dictionary-like results"""
-        if not self.connection or self.connection.closed:
-            self.connect()
-        return self.connection.cursor(cursor_factory=RealDictCursor)
-    
-    def commit(self):
-        """Commit current transaction"""
-        if self.connection:
-            self.connection.commit()
-    
-    def rollback(self):
-        """Rollback current transaction"""
-        if self.connection:
-            self.connection.rollback()
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+_pool = None
+_pool_lock = asyncio.Lock()
 
-# Global database instance
-db = DatabaseConnection()
+async def get_pool() -> asyncpg.Pool:
+    """Get the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                # Each pooled connection prepares and caches the statements
+                # it runs, so repeated queries skip parse/plan
+                _pool = await asyncpg.create_pool(
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    record_class=Record,
+                    **DB_CONFIG
+                )
+                logger.info("Database connection pool created")
+    return _pool
 
-def get_db_connection():
-    """Dependency function to get database connection"""
-    try:
-        db.connect()
-        yield db
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        raise
-    finally:
-        db.disconnect()
\ No newline at end of file
+async def close_pool():
+    """Close the connection pool and all of its connections"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        logger.info("Database connection pool closed")
\ No newline at end of file
@@ -8,21 +8,25 @@
 #     return {"message": "Hello World"}
 
 
-from fastapi import FastAPI, HTTPException, status, Depends, Security
+from fastapi import FastAPI, HTTPException, status, Depends, Query, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncpg
 # from typing import List, Optional
 import logging
 from datetime import timedelta
 
 # Import models and services
 from models import (
-    UserCreate, UserResponse, UserUpdate, UserLogin, 
-    Token, APIResponse
+    UserCreate, UserResponse, UserLogin, 
+    Token, APIResponse, UsersListResponse
 )
-from database import get_db_connection, DatabaseConnection
+from user_update import UserUpdate
+from database import get_pool, close_pool
 from user_service import UserService
-from auth import auth_manager
+from auth import auth_manager, log_crypto_backend, warm_up, shutdown_hash_pool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,7 +36,9 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Shop_user_API",
     description="Authentication API for Flutter app with PostgreSQL backend",
-    version="1.0.0"
+    version="1.0.0",
+    # Serialize response bodies with orjson
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS for Flutter app
@@ -47,6 +53,27 @@ app.add_middleware(
 # Security
 security = HTTPBearer()
 
+@app.on_event("startup")
+async def startup():
+    """Report the crypto backend and warm up auth and database paths"""
+    log_crypto_backend()
+    await run_in_threadpool(warm_up)
+    # Start a hashing worker so the first login doesn't wait for the spawn
+    await auth_manager.hash_password_async("warmup")
+    
+    try:
+        # Open the pool's initial connections before the first request
+        await get_pool()
+    except Exception as e:
+        # Requests retry pool creation; /health reports the outage meanwhile
+        logger.error(f"Could not create database pool at startup: {e}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled database connections and hashing workers"""
+    await close_pool()
+    shutdown_hash_pool()
+
 def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     """Dependency to get current authenticated user"""
     token = credentials.credentials
@@ -63,9 +90,8 @@ async def health_check():
     """Detailed health check"""
     try:
         # Test database connection
-        db = DatabaseConnection()
-        db.connect()
-        db.disconnect()
+        pool = await get_pool()
+        await pool.fetchval("SELECT 1")
         
         return {
             "status": "healthy",
@@ -83,12 +109,12 @@ async def health_check():
 @app.post("/auth/register", response_model=APIResponse, tags=["Authentication"])
 async def register_user(
     user_data: UserCreate,
-    db: DatabaseConnection = Depends(get_db_connection)
+    db: asyncpg.Pool = Depends(get_pool)
 ):
     """Register a new user"""
     try:
         user_service = UserService(db)
-        new_user = user_service.create_user(user_data)
+        new_user = await user_service.create_user(user_data)
         
         return APIResponse(
             success=True,
@@ -113,12 +139,12 @@ async def register_user(
 @app.post("/auth/login", response_model=dict, tags=["Authentication"])
 async def login_user(
     user_credentials: UserLogin,
-    db: DatabaseConnection = Depends(get_db_connection)
+    db: asyncpg.Pool = Depends(get_pool)
 ):
     """Login user and return JWT token"""
     try:
         user_service = UserService(db)
-        user = user_service.authenticate_user(
+        user = await user_service.authenticate_user(
             user_credentials.username, 
             user_credentials.password
         )
@@ -160,12 +186,12 @@ async def login_user(
 @app.post("/users", response_model=APIResponse, tags=["Users"])
 async def create_user(
     user_data: UserCreate,
-    db: DatabaseConnection = Depends(get_db_connection)
+    db: asyncpg.Pool = Depends(get_pool)
 ):
     """Create a new user (alternative endpoint)"""
     try:
         user_service = UserService(db)
-        new_user = user_service.create_user(user_data)
+        new_user = await user_service.create_user(user_data)
         
         return APIResponse(
             success=True,
@@ -187,27 +213,26 @@ async def create_user(
             detail="Internal server error"
         )
 
-@app.get("/users", response_model=APIResponse, tags=["Users"])
+@app.get("/users", response_model=UsersListResponse, tags=["Users"])
 async def get_users(
-    limit: int = 100,
-    offset: int = 0,
-    db: DatabaseConnection = Depends(get_db_connection),
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: int = 0,
+    db: asyncpg.Pool = Depends(get_pool),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all users with pagination (requires authentication)"""
+    """Get users page by page, ordered by ID (requires authentication)"""
     try:
         user_service = UserService(db)
-        users = user_service.get_all_users(limit=limit, offset=offset)
+        users = await user_service.get_all_users(limit=limit, after_id=after_id)
         
-        return APIResponse(
-            success=True,
-            message=f"Retrieved {len(users)} users",
-            data={
-                "users": users,
-                "limit": limit,
-                "offset": offset
-            }
-        )
+        # Validated and serialized once against response_model
+        return {
+            "users": users,
+            "limit": limit,
+            "after_id": after_id,
+            # Pass as after_id to fetch the following page
+            "next_after_id": users[-1]["id"] if len(users) == limit else None
+        }
         
     except Exception as e:
         logger.error(f"Error getting users: {e}")
@@ -216,16 +241,16 @@ async def get_users(
             detail="Internal server error"
         )
 
-@app.get("/users/{user_id}", response_model=APIResponse, tags=["Users"])
+@app.get("/users/{user_id}", response_model=UserResponse, tags=["Users"])
 async def get_user(
     user_id: int,
-    db: DatabaseConnection = Depends(get_db_connection),
+    db: asyncpg.Pool = Depends(get_pool),
     current_user: dict = Depends(get_current_user)
 ):
     """Get a specific user by ID (requires authentication)"""
     try:
         user_service = UserService(db)
-        user = user_service.get_user_by_id(user_id)
+        user = await user_service.get_user_by_id(user_id)
         
         if not user:
             raise HTTPException(
@@ -233,13 +258,7 @@ async def get_user(
                 detail="User not found"
             )
         
-        return APIResponse(
-            success=True,
-            message="User retrieved successfully",
-            data={
-                "user": user
-            }
-        )
+        return user
         
     except HTTPException:
         raise
@@ -250,16 +269,16 @@ async def get_user(
             detail="Internal server error"
         )
 
-@app.get("/users/username/{username}", response_model=APIResponse, tags=["Users"])
+@app.get("/users/username/{username}", response_model=UserResponse, tags=["Users"])
 async def get_user_by_username(
     username: str,
-    db: DatabaseConnection = Depends(get_db_connection),
+    db: asyncpg.Pool = Depends(get_pool),
     current_user: dict = Depends(get_current_user)
 ):
     """Get a user by username (requires authentication)"""
     try:
         user_service = UserService(db)
-        user = user_service.get_user_by_username(username)
+        user = await user_service.get_user_by_username(username)
         
         if not user:
             raise HTTPException(
@@ -267,13 +286,7 @@ async def get_user_by_username(
                 detail="User not found"
             )
             
-        return APIResponse(
-            success=True,
-            message="User retrieved successfully",
-            data={
-                "user": user
-            }
-        )
+        return user
         
     except HTTPException:
         raise
@@ -288,7 +301,7 @@ async def get_user_by_username(
 # async def update_user(
 #     user_id: int,
 #     user_data: UserUpdate,
-#     db: DatabaseConnection = Depends(get_db_connection),
+#     db: asyncpg.Pool = Depends(get_pool),
 #     current_user: dict = Depends(get_current_user)
 # ):
 #     """Update a user (requires authentication)"""
@@ -363,7 +376,7 @@ async def get_user_by_username(
 @app.delete("/users/{user_id}", response_model=APIResponse, tags=["Users"])
 async def delete_user(
     user_id: int,
-            db: DatabaseConnection = Depends(get_db_connection),
+            db: asyncpg.Pool = Depends(get_pool),
             current_user: dict = Depends(get_current_user)
 ):
     """Delete a user (requires authentication)"""
@@ -371,7 +384,7 @@ async def delete_user(
         user_service = UserService(db)
         
         # Get current user info for authorization
-        current_user_data = user_service.get_user_by_username(current_user["username"])
+        current_user_data = await user_service.get_user_by_username(current_user["username"])
         if not current_user_data:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -385,8 +398,7 @@ async def delete_user(
                 detail="You can only delete your own account"
             )
         
-        # Call delete_user with only user_id (matching your original method signature)
-        deleted = user_service.delete_user(user_id,requesting_user_id=user_id)  # Only 2 args: self, user_id
+        deleted = await user_service.delete_user(user_id)
         
         if deleted:
             return APIResponse(
@@ -468,47 +480,50 @@ async def refresh_token(
 async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    db: DatabaseConnection = Depends(get_db_connection),
+    db: asyncpg.Pool = Depends(get_pool),
     current_user: dict = Depends(get_current_user)
 ):
     """Update a user (requires authentication)"""
     try:
         user_service = UserService(db)
         
-        # Optional: Add authorization check
-        # Users can only update their own profile unless they're admin
-        current_user_data = user_service.get_user_by_username(current_user["username"])
-        if not current_user_data:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid user session"
-            )
-        
-        # Allow users to update only their own profile (add admin check if needed)
-        if current_user_data["id"] != user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You can only update your own profile"
-            )
-        
-        # If password is being updated, verify current password
-        if user_data.password is not None:
-            if not user_data.current_password:
+        # Lock the caller's row once and reuse it for every check below, so
+        # the whole update is one transaction and no repeated lookups
+        async with user_service.transaction():
+            # Optional: Add authorization check
+            # Users can only update their own profile unless they're admin
+            current_user_data = await user_service.get_and_lock_user(current_user["username"])
+            if not current_user_data:
                 raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Current password is required for password updates"
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid user session"
                 )
             
-            # Verify current password
-            if not auth_manager.verify_password(user_data.current_password, 
-                                               user_service.get_user_by_username(current_user["username"])["password"]):
+            # Allow users to update only their own profile (add admin check if needed)
+            if current_user_data["id"] != user_id:
                 raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Current password is incorrect"
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="You can only update your own profile"
                 )
-        
-        # Perform the update
-        updated_user = user_service.update_user(user_id, user_data)
+            
+            # If password is being updated, verify current password
+            if user_data.password is not None:
+                if not user_data.current_password:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Current password is required for password updates"
+                    )
+                
+                # Verify current password
+                if not await auth_manager.verify_password_async(user_data.current_password, 
+                                                                current_user_data["password"]):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Current password is incorrect"
+                    )
+            
+            # Perform the update
+            updated_user = await user_service.update_user(user_id, user_data)
         
         if not updated_user:
             raise HTTPException(
@@ -0,0 +1,12 @@
+-- Case-insensitive usernames and unique index lookups for users.
+--
+-- get_user_by_username / authenticate_user look users up by username and
+-- email, and get_all_users pages by primary key (keyset pagination), so
+-- all three are served by index probes rather than sequential scans.
+
+CREATE EXTENSION IF NOT EXISTS citext;
+
+ALTER TABLE users ALTER COLUMN username TYPE citext;
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON users (username);
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_key ON users (email);
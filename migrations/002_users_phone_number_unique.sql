@@ -0,0 +1,5 @@
+-- create_user relies on a unique index for every column that must not be
+-- duplicated, and maps the violated index name (users_<column>_key) to
+-- the error it reports. Keep these names in sync with user_service.py.
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_phone_number_key ON users (phone_number);
@@ -1,6 +1,16 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
+from typing import List, Optional
 from datetime import datetime
+import re
+
+# Optional leading "+" followed by 10-20 ASCII digits, compiled once at import
+_PHONE_RE = re.compile(r'\+?[0-9]{10,20}')
+
+def _check_phone_number(v: Optional[str]) -> Optional[str]:
+    """Validate a phone number against the precompiled pattern"""
+    if v is not None and not _PHONE_RE.fullmatch(v):
+        raise ValueError('Phone number must be 10 to 20 digits, optionally prefixed with +')
+    return v
 
 class UserCreate(BaseModel):
     """Model for creating a new user"""
@@ -9,8 +19,15 @@ class UserCreate(BaseModel):
     phone_number: str = Field(..., min_length=10, max_length=20, description="Phone number must be between 10 and 20 characters")
     password: str = Field(..., min_length=6, description="Password must be at least 6 characters long")
     
-    class Config:
-        json_schema_extra = {
+    @field_validator('phone_number')
+    @classmethod
+    def validate_phone_number(cls, v):
+        return _check_phone_number(v)
+    
+    model_config = ConfigDict(
+        # Unknown fields are rejected during validation, before the handler runs
+        extra="forbid",
+        json_schema_extra={
             "example": {
                 "username": "john_doe",
                 "email": "john.doe@example.com",
@@ -18,6 +35,7 @@ class UserCreate(BaseModel):
                 "password": "securepassword123"
             }
         }
+    )
 
 class UserResponse(BaseModel):
     """Model for user response (without password)"""
@@ -28,9 +46,9 @@ class UserResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
-        json_schema_extra = {
+    model_config = ConfigDict(
+        from_attributes=True,
+        json_schema_extra={
             "example": {
                 "id": 1,
                 "username": "john_doe",
@@ -40,35 +58,28 @@ class UserResponse(BaseModel):
                 "updated_at": "2024-01-01T12:00:00Z"
             }
         }
+    )
 
-class UserUpdate(BaseModel):
-    """Model for updating user information"""
-    username: Optional[str] = Field(None, min_length=3, max_length=50)
-    email: Optional[EmailStr] = None
-    phone_number: Optional[str] = Field(None, min_length=10, max_length=20)
-    password: Optional[str] = Field(None, min_length=6)
-    
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "username": "john_doe_updated",
-                "email": "john.updated@example.com",
-                "phone_number": "+1234567891"
-            }
-        }
+class UsersListResponse(BaseModel):
+    """Model for a page of users"""
+    users: List[UserResponse]
+    limit: int
+    after_id: int
+    next_after_id: Optional[int] = None
 
 class UserLogin(BaseModel):
     """Model for user login"""
     username: str = Field(..., description="Username or email")
     password: str = Field(..., description="User password")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "username": "john_doe",
                 "password": "securepassword123"
             }
         }
+    )
 
 class Token(BaseModel):
     """Model for authentication token"""
@@ -85,11 +96,12 @@ class APIResponse(BaseModel):
     message: str
     data: Optional[dict] = None
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "success": True,
                 "message": "Operation completed successfully",
                 "data": {}
             }
-        }
\ No newline at end of file
+        }
+    )
\ No newline at end of file
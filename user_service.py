@@ -1,280 +1,545 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import List, Optional
+import asyncpg
+from cachetools import TTLCache
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple, Union
+import asyncio
+import hashlib
+import hmac
 import logging
-from models import UserCreate, UserUpdate, UserResponse
+import secrets
+from models import UserCreate, UserResponse
+from user_update import UserUpdate
 from auth import auth_manager
-from database import DatabaseConnection
 
 logger = logging.getLogger(__name__)
 
+# Recently verified logins: identifier -> (credential digest, user row).
+# Only touched from the event loop, so no lock is needed. The pepper is
+# per-process, so digests are useless outside this worker. An entry only
+# counts while its row is still the one in the id cache (see _is_current).
+LOGIN_CACHE_SIZE = 1000
+LOGIN_CACHE_TTL_SECONDS = 30
+_login_cache = TTLCache(maxsize=LOGIN_CACHE_SIZE, ttl=LOGIN_CACHE_TTL_SECONDS)
+_LOGIN_CACHE_PEPPER = secrets.token_bytes(32)
+
+# Verified against when a login names an unknown user, so that path costs
+# the same hashing work as a real verification and does not leak existence
+_DUMMY_PASSWORD_HASH = auth_manager.hash_password(secrets.token_urlsafe(16))
+
+# Public user rows (never the password hash) for the by-id/username/email
+# lookups. Per-process and event-loop only, like the login cache; the TTL
+# bounds how stale a row changed by another worker can be. The username
+# and email caches share the id cache's row objects and only count while
+# the id cache still holds that same object, so evicting a user is one
+# pop from the id cache.
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL_SECONDS = 30
+_user_cache_by_id = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+_user_cache_by_username = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+_user_cache_by_email = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+# Every eviction takes the next sequence number and records it for the
+# user. Readers note the sequence before querying and skip caching when
+# the user was evicted since, so a row or login read before a committed
+# change is never cached after that change has been evicted.
+EVICTION_MEMORY_SECONDS = 300
+_eviction_seq = 0
+_user_eviction_seq = TTLCache(maxsize=USER_CACHE_SIZE, ttl=EVICTION_MEMORY_SECONDS)
+
+def _evicted_since(user_id: int, seq: int) -> bool:
+    """Whether a user's cached data was evicted after sequence number seq"""
+    return _user_eviction_seq.get(user_id, 0) > seq
+
+def _cache_user(user: dict, seq: int):
+    """Make a public user row, read after sequence number seq, available to all three lookups"""
+    if _evicted_since(user['id'], seq):
+        return
+    _user_cache_by_id[user['id']] = user
+    # usernames are case-insensitive (citext)
+    _user_cache_by_username[user['username'].lower()] = user
+    _user_cache_by_email[user['email']] = user
+
+def _is_current(user: Optional[dict]) -> bool:
+    """Whether a row from a secondary cache is still the id cache's row for that user"""
+    return user is not None and _user_cache_by_id.get(user['id']) is user
+
+def _evict_cached_user(user_id: int):
+    """Drop a changed user's row, invalidating every cache entry that shares it"""
+    user = _user_cache_by_id.pop(user_id, None)
+    if user is None:
+        return
+    # Already invalid; popped only to free the slots early
+    for cache, key in (
+        (_user_cache_by_username, user['username'].lower()),
+        (_user_cache_by_email, user['email']),
+    ):
+        if cache.get(key) is user:
+            cache.pop(key, None)
+
+# Rows fetched per round-trip when streaming all users
+USER_EXPORT_PREFETCH = 500
+
+# Unique index on users -> error reported when an INSERT collides with it
+_UNIQUE_VIOLATION_MESSAGES = {
+    'users_username_key': "Username already exists",
+    'users_email_key': "Email already exists",
+    'users_phone_number_key': "Phone number already exists",
+}
+
+# update_user's UPDATE statement per combination of changed columns (at
+# most 16), built once per process; asyncpg then prepares each text once
+# per connection
+_UPDATE_QUERIES = {}
+
+def _update_query(columns: Tuple[str, ...]) -> str:
+    """UPDATE setting the given columns ($1..$n) for the user id in $n+1"""
+    query = _UPDATE_QUERIES.get(columns)
+    if query is None:
+        assignments = ', '.join(f"{column} = ${n}" for n, column in enumerate(columns, 1))
+        query = f"""
+            UPDATE users
+            SET {assignments}, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ${len(columns) + 1}
+            RETURNING id, username, email, phone_number, created_at, updated_at
+        """
+        _UPDATE_QUERIES[columns] = query
+    return query
+
+def _login_digest(identifier: str, password: str) -> bytes:
+    """Keyed digest of a login attempt, safe to keep in memory"""
+    return hmac.new(_LOGIN_CACHE_PEPPER, f"{identifier}:{password}".encode(), hashlib.sha256).digest()
+
+def _evict_user(user_id: int):
+    """Drop everything cached about a user whose row has changed"""
+    global _eviction_seq
+    _eviction_seq += 1
+    _user_eviction_seq[user_id] = _eviction_seq
+    # Cached logins hold the id cache's row, so this invalidates them too
+    _evict_cached_user(user_id)
+
 class UserService:
     """Service class for user CRUD operations"""
     
-    def __init__(self, db: DatabaseConnection):
-        self.db = db
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self._transaction_connection = None
+        self._pending_evictions = None
+    
+    @property
+    def _executor(self) -> Union[asyncpg.Pool, asyncpg.Connection]:
+        """Connection of the open transaction, else the pool (one connection per query)"""
+        return self._transaction_connection or self.pool
     
-    def create_user(self, user_data: UserCreate) -> dict:
+    @asynccontextmanager
+    async def transaction(self):
+        """Run the service calls made inside the block on one connection, in one transaction"""
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                self._transaction_connection = connection
+                self._pending_evictions = []
+                try:
+                    yield
+                finally:
+                    self._transaction_connection = None
+                    pending_evictions, self._pending_evictions = self._pending_evictions, None
+            # Committed: evicting any earlier would let readers re-cache the
+            # old row before the change became visible to them
+            for user_id in pending_evictions:
+                _evict_user(user_id)
+    
+    def _cache(self, user: dict, seq: int):
+        """Cache a public row, unless it was read inside a transaction (and may not be committed)"""
+        if self._transaction_connection is None:
+            _cache_user(user, seq)
+    
+    def _evict(self, user_id: int):
+        """Evict a changed user now, or once the open transaction commits"""
+        if self._pending_evictions is not None:
+            self._pending_evictions.append(user_id)
+        else:
+            _evict_user(user_id)
+    
+    async def create_user(self, user_data: UserCreate) -> dict:
         """Create a new user in the database"""
         try:
-            cursor = self.db.get_cursor()
+            # Hash the password (CPU bound, runs in the hashing process pool)
+            hashed_password = await auth_manager.hash_password_async(user_data.password)
             
-            # Check if username, email, or phone number already exists
-            check_query = """
-                SELECT username, email, phone_number 
-                FROM users 
-                WHERE username = %s OR email = %s OR phone_number = %s
-            """
-            cursor.execute(check_query, (user_data.username, user_data.email, user_data.phone_number))
-            existing_user = cursor.fetchone()
-            
-            if existing_user:
-                if existing_user['username'] == user_data.username:
-                    raise ValueError("Username already exists")
-                elif existing_user['email'] == user_data.email:
-                    raise ValueError("Email already exists")
-                elif existing_user['phone_number'] == user_data.phone_number:
-                    raise ValueError("Phone number already exists")
-            
-            # Hash the password
-            hashed_password = auth_manager.hash_password(user_data.password)
-            
-            # Insert new user
+            # Insert new user; the unique indexes reject duplicates atomically
             insert_query = """
                 INSERT INTO users (username, email, phone_number, password)
-                VALUES (%s, %s, %s, %s)
+                VALUES ($1, $2, $3, $4)
                 RETURNING id, username, email, phone_number, created_at, updated_at
             """
-            cursor.execute(insert_query, (
-                user_data.username,
-                user_data.email,
-                user_data.phone_number,
-                hashed_password
-            ))
-            
-            new_user = cursor.fetchone()
-            self.db.commit()
-            
-            logger.info(f"User created successfully: {user_data.username}")
+            try:
+                new_user = await self._executor.fetchrow(
+                    insert_query,
+                    user_data.username,
+                    user_data.email,
+                    user_data.phone_number,
+                    hashed_password
+                )
+            except asyncpg.UniqueViolationError as e:
+                raise ValueError(_UNIQUE_VIOLATION_MESSAGES.get(e.constraint_name, "User already exists"))
+            
+            logger.info("User created successfully: %s", user_data.username)
             return dict(new_user)
-            
-        except psycopg2.Error as e:
-            self.db.rollback()
-            logger.error(f"Database error creating user: {e}")
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error creating user: %s", e)
             raise ValueError(f"Database error: {e}")
         except Exception as e:
-            self.db.rollback()
-            logger.error(f"Error creating user: {e}")
+            logger.error("Error creating user: %s", e)
             raise
-        finally:
-            if cursor:
-                cursor.close()
     
-    def get_user_by_id(self, user_id: int) -> Optional[dict]:
+    async def get_user_by_id(self, user_id: int) -> Optional[dict]:
         """Get a user by ID"""
+        cached = _user_cache_by_id.get(user_id)
+        if cached is not None:
+            return dict(cached)
+        
         try:
-            cursor = self.db.get_cursor()
-            
             query = """
                 SELECT id, username, email, phone_number, created_at, updated_at
                 FROM users
-                WHERE id = %s
+                WHERE id = $1
             """
-            cursor.execute(query, (user_id,))
-            user = cursor.fetchone()
+            seq = _eviction_seq
+            user = await self._executor.fetchrow(query, user_id)
             
-            return dict(user) if user else None
+            if not user:
+                return None
             
-        except psycopg2.Error as e:
-            logger.error(f"Database error getting user by ID: {e}")
+            user = dict(user)
+            self._cache(user, seq)
+            return dict(user)
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error getting user by ID: %s", e)
             raise ValueError(f"Database error: {e}")
-        finally:
-            if cursor:
-                cursor.close()
     
-    def get_user_by_username(self, username: str) -> Optional[dict]:
-        """Get a user by username (includes password for authentication)"""
+    async def get_user_by_username(self, username: str) -> Optional[dict]:
+        """Get a user by username"""
+        cached = _user_cache_by_username.get(username.lower())
+        if _is_current(cached):
+            return dict(cached)
+        
         try:
-            cursor = self.db.get_cursor()
+            query = """
+                SELECT id, username, email, phone_number, created_at, updated_at
+                FROM users
+                WHERE username = $1
+            """
+            seq = _eviction_seq
+            user = await self._executor.fetchrow(query, username)
             
+            if not user:
+                return None
+            
+            user = dict(user)
+            self._cache(user, seq)
+            return dict(user)
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error getting user by username: %s", e)
+            raise ValueError(f"Database error: {e}")
+    
+    async def get_and_lock_user(self, username: str) -> Optional[dict]:
+        """Get a user by username (including password) and lock the row for update"""
+        try:
             query = """
                 SELECT id, username, email, phone_number, password, created_at, updated_at
                 FROM users
-                WHERE username = %s
+                WHERE username = $1
+                FOR UPDATE
             """
-            cursor.execute(query, (username,))
-            user = cursor.fetchone()
+            user = await self._executor.fetchrow(query, username)
             
             return dict(user) if user else None
-            
-        except psycopg2.Error as e:
-            logger.error(f"Database error getting user by username: {e}")
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error locking user by username: %s", e)
             raise ValueError(f"Database error: {e}")
-        finally:
-            if cursor:
-                cursor.close()
     
-    def get_user_by_email(self, email: str) -> Optional[dict]:
+    async def get_user_by_email(self, email: str) -> Optional[dict]:
         """Get a user by email"""
+        cached = _user_cache_by_email.get(email)
+        if _is_current(cached):
+            return dict(cached)
+        
         try:
-            cursor = self.db.get_cursor()
-            
             query = """
                 SELECT id, username, email, phone_number, created_at, updated_at
                 FROM users
-                WHERE email = %s
+                WHERE email = $1
             """
-            cursor.execute(query, (email,))
-            user = cursor.fetchone()
+            seq = _eviction_seq
+            user = await self._executor.fetchrow(query, email)
             
-            return dict(user) if user else None
+            if not user:
+                return None
             
-        except psycopg2.Error as e:
-            logger.error(f"Database error getting user by email: {e}")
+            user = dict(user)
+            self._cache(user, seq)
+            return dict(user)
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error getting user by email: %s", e)
             raise ValueError(f"Database error: {e}")
-        finally:
-            if cursor:
-                cursor.close()
     
-    def get_all_users(self, limit: int = 100, offset: int = 0) -> List[dict]:
-        """Get all users with pagination"""
+    async def get_all_users(self, limit: int = 100, after_id: int = 0) -> List[asyncpg.Record]:
+        """Get users with keyset pagination, ordered by ID, starting after after_id"""
         try:
-            cursor = self.db.get_cursor()
-            
             query = """
                 SELECT id, username, email, phone_number, created_at, updated_at
                 FROM users
-                ORDER BY created_at DESC
-                LIMIT %s OFFSET %s
+                WHERE id > $1
+                ORDER BY id
+                LIMIT $2
             """
-            cursor.execute(query, (limit, offset))
-            users = cursor.fetchall()
-            
-            return [dict(user) for user in users]
-            
-        except psycopg2.Error as e:
-            logger.error(f"Database error getting all users: {e}")
+            # Rows are returned without a dict copy: database.Record exposes
+            # columns as attributes, which is all UserResponse needs
+            return await self._executor.fetch(query, after_id, limit)
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error getting all users: %s", e)
             raise ValueError(f"Database error: {e}")
-        finally:
-            if cursor:
-                cursor.close()
     
-    def update_user(self, user_id: int, user_data: UserUpdate) -> Optional[dict]:
+    async def iter_all_users(self, after_id: int = 0) -> AsyncIterator[asyncpg.Record]:
+        """Stream every user after after_id, ordered by ID, through a server-side cursor
+        
+        The cursor holds a pooled connection until the generator finishes;
+        callers that may stop early should wrap it in contextlib.aclosing():
+        
+            async with aclosing(user_service.iter_all_users()) as users:
+                async for user in users:
+                    ...
+        """
+        query = """
+            SELECT id, username, email, phone_number, created_at, updated_at
+            FROM users
+            WHERE id > $1
+            ORDER BY id
+        """
+        try:
+            # Cursors only live inside a transaction. It is kept on a
+            # connection of its own, so other calls on this service never
+            # run inside it; only one prefetch batch is held in memory
+            async with self.pool.acquire() as connection, connection.transaction(readonly=True):
+                async for user in connection.cursor(query, after_id, prefetch=USER_EXPORT_PREFETCH):
+                    yield user
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error streaming users: %s", e)
+            raise ValueError(f"Database error: {e}")
+    
+    async def update_user(self, user_id: int, user_data: UserUpdate) -> Optional[dict]:
         """Update user information"""
         try:
-            cursor = self.db.get_cursor()
-            
-            # Build dynamic update query
-            update_fields = []
+            # Columns being changed, in a fixed order, pick the cached statement
+            columns = []
             values = []
             
             if user_data.username is not None:
-                update_fields.append("username = %s")
+                columns.append('username')
                 values.append(user_data.username)
             
             if user_data.email is not None:
-                update_fields.append("email = %s")
+                columns.append('email')
                 values.append(user_data.email)
             
             if user_data.phone_number is not None:
-                update_fields.append("phone_number = %s")
+                columns.append('phone_number')
                 values.append(user_data.phone_number)
             
             if user_data.password is not None:
-                update_fields.append("password = %s")
-                values.append(auth_manager.hash_password(user_data.password))
+                columns.append('password')
+                values.append(await auth_manager.hash_password_async(user_data.password))
             
-            if not update_fields:
+            if not columns:
                 raise ValueError("No fields to update")
             
-            values.append(user_id)
+            query = _update_query(tuple(columns))
             
-            query = f"""
-                UPDATE users 
-                SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-                RETURNING id, username, email, phone_number, created_at, updated_at
-            """
-            
-            cursor.execute(query, values)
-            updated_user = cursor.fetchone()
+            updated_user = await self._executor.fetchrow(query, *values, user_id)
             
             if updated_user:
-                self.db.commit()
-                logger.info(f"User updated successfully: {user_id}")
+                self._evict(user_id)
+                logger.info("User updated successfully: %s", user_id)
                 return dict(updated_user)
             else:
                 return None
-                
-        except psycopg2.Error as e:
-            self.db.rollback()
-            logger.error(f"Database error updating user: {e}")
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error updating user: %s", e)
             raise ValueError(f"Database error: {e}")
         except Exception as e:
-            self.db.rollback()
-            logger.error(f"Error updating user: {e}")
+            logger.error("Error updating user: %s", e)
             raise
-        finally:
-            if cursor:
-                cursor.close()
     
-    def delete_user(self, user_id: int) -> bool:
+    async def bulk_update_users(self, updates: List[Tuple[int, UserUpdate]]) -> List[dict]:
+        """Update many users in one statement (e.g. admin password resets)"""
+        try:
+            user_ids = [user_id for user_id, _ in updates]
+            if len(set(user_ids)) != len(user_ids):
+                raise ValueError("Each user can only appear once per bulk update")
+            
+            for user_id, user_data in updates:
+                if all(value is None for value in (
+                    user_data.username, user_data.email, user_data.phone_number, user_data.password
+                )):
+                    raise ValueError(f"No fields to update for user {user_id}")
+            
+            # Hash all new passwords in parallel across the hashing process pool
+            async def hash_or_none(password: Optional[str]) -> Optional[str]:
+                return await auth_manager.hash_password_async(password) if password is not None else None
+            
+            hashed_passwords = await asyncio.gather(
+                *(hash_or_none(user_data.password) for _, user_data in updates)
+            )
+            
+            # One round-trip: unnest the columns into rows and join on id;
+            # NULL means "leave unchanged"
+            query = """
+                UPDATE users
+                SET username = COALESCE(v.username, users.username),
+                    email = COALESCE(v.email, users.email),
+                    phone_number = COALESCE(v.phone_number, users.phone_number),
+                    password = COALESCE(v.password, users.password),
+                    updated_at = CURRENT_TIMESTAMP
+                FROM unnest($1::int[], $2::text[], $3::text[], $4::text[], $5::text[])
+                    AS v(id, username, email, phone_number, password)
+                WHERE users.id = v.id
+                RETURNING users.id, users.username, users.email, users.phone_number,
+                          users.created_at, users.updated_at
+            """
+            updated_users = await self._executor.fetch(
+                query,
+                user_ids,
+                [user_data.username for _, user_data in updates],
+                [user_data.email for _, user_data in updates],
+                [user_data.phone_number for _, user_data in updates],
+                hashed_passwords
+            )
+            
+            for user in updated_users:
+                self._evict(user['id'])
+            
+            logger.info("Bulk updated %s users", len(updated_users))
+            return [dict(user) for user in updated_users]
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error bulk updating users: %s", e)
+            raise ValueError(f"Database error: {e}")
+        except Exception as e:
+            logger.error("Error bulk updating users: %s", e)
+            raise
+    
+    async def delete_user(self, user_id: int) -> bool:
         """Delete a user by ID"""
         try:
-            cursor = self.db.get_cursor()
-            
-            query = "DELETE FROM users WHERE id = %s RETURNING id"
-            cursor.execute(query, (user_id,))
-            deleted_user = cursor.fetchone()
-            
-            if deleted_user:
-                self.db.commit()
-                logger.info(f"User deleted successfully: {user_id}")
+            query = "DELETE FROM users WHERE id = $1"
+            # execute() returns the command tag, e.g. "DELETE 1"; no rows
+            # are sent back
+            status = await self._executor.execute(query, user_id)
+            
+            if status == "DELETE 1":
+                self._evict(user_id)
+                logger.info("User deleted successfully: %s", user_id)
                 return True
             else:
                 return False
-                
-        except psycopg2.Error as e:
-            self.db.rollback()
-            logger.error(f"Database error deleting user: {e}")
+        
+        except asyncpg.PostgresError as e:
+            logger.error("Database error deleting user: %s", e)
             raise ValueError(f"Database error: {e}")
-        finally:
-            if cursor:
-                cursor.close()
     
     
     
-    def authenticate_user(self, username: str, password: str) -> Optional[dict]:
+    async def _rehash_password(self, user_id: int, password: str, verified_hash: str):
+        """Store a fresh hash of a just-verified password"""
+        try:
+            new_hash = await auth_manager.hash_password_async(password)
+            # Only replace the hash that was verified: if the password was
+            # changed while we were hashing, the upgrade is dropped rather
+            # than reverting the change
+            status = await self._executor.execute(
+                "UPDATE users SET password = $1 WHERE id = $2 AND password = $3",
+                new_hash, user_id, verified_hash
+            )
+            if status == "UPDATE 1":
+                logger.info("Password hash upgraded for user: %s", user_id)
+        except Exception as e:
+            # The old hash still works, so a failed upgrade must not fail the login
+            logger.warning("Could not upgrade password hash for user %s: %s", user_id, e)
+    
+    async def _get_auth_row(self, identifier: str) -> Optional[asyncpg.Record]:
+        """Get the id, username and password hash of the user a login identifier names"""
+        # Look the identifier up as a username and as an email in one
+        # round-trip (both branches are unique index probes); a username
+        # match wins. The row carries the password hash, so it bypasses the
+        # user caches and, via the leading /*NO QUERY CACHE*/ (which must
+        # open the statement), Pgpool-II's in-memory query cache too
+        query = """/*NO QUERY CACHE*/
+            SELECT id, username, password
+            FROM (
+                SELECT 0 AS match_order, id, username, password
+                FROM users
+                WHERE username = $1
+                UNION ALL
+                SELECT 1, id, username, password
+                FROM users
+                WHERE email = $1
+            ) AS matches
+            ORDER BY match_order
+            LIMIT 1
+        """
+        return await self._executor.fetchrow(query, identifier)
+    
+    async def authenticate_user(self, username: str, password: str) -> Optional[dict]:
         """Authenticate a user"""
         try:
-            # Get user by username (try username first, then email)
-            user = self.get_user_by_username(username)
+            # Repeated logins within the cache TTL skip the database and bcrypt
+            digest = _login_digest(username, password)
+            cached = _login_cache.get(username)
+            if cached is not None and _is_current(cached[1]) and hmac.compare_digest(cached[0], digest):
+                return dict(cached[1])
             
-            if not user:
-                # Try with email if username lookup fails
-                cursor = self.db.get_cursor()
-                query = """
-                    SELECT id, username, email, phone_number, password, created_at, updated_at
-                    FROM users
-                    WHERE email = %s
-                """
-                cursor.execute(query, (username,))
-                user = cursor.fetchone()
-                if user:
-                    user = dict(user)
-                cursor.close()
+            seq = _eviction_seq
+            auth_row = await self._get_auth_row(username)
             
-            if not user:
+            if not auth_row:
+                await auth_manager.verify_password_async(password, _DUMMY_PASSWORD_HASH)
                 return None
             
+            stored_hash = auth_row['password']
+            
             # Verify password
-            if not auth_manager.verify_password(password, user['password']):
+            if not await auth_manager.verify_password_async(password, stored_hash):
                 return None
             
-            # Remove password from response
-            user_response = {k: v for k, v in user.items() if k != 'password'}
-            return user_response
+            # Upgrade legacy bcrypt hashes or outdated argon2 parameters
+            if auth_manager.needs_rehash(stored_hash):
+                await self._rehash_password(auth_row['id'], password, stored_hash)
+            
+            # Only a verified login fetches the full public row, usually
+            # straight from the user cache
+            user = await self.get_user_by_id(auth_row['id'])
+            if user and user['username'] != auth_row['username']:
+                # The cached row predates a rename (e.g. on another worker);
+                # the token is minted from the username, so re-read it
+                _evict_cached_user(auth_row['id'])
+                user = await self.get_user_by_id(auth_row['id'])
+            if not user:
+                return None
             
+            # Only successful verifications are cached, and not when the
+            # user changed (e.g. a new password) while this login was in flight
+            cached_user = _user_cache_by_id.get(auth_row['id'])
+            if cached_user is not None and not _evicted_since(auth_row['id'], seq):
+                _login_cache[username] = (digest, cached_user)
+            return dict(user)
+        
         except Exception as e:
-            logger.error(f"Error authenticating user: {e}")
+            logger.error("Error authenticating user: %s", e)
             return None
\ No newline at end of file
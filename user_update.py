@@ -1,6 +1,11 @@
-from pydantic import BaseModel, EmailStr, Field, field_validator
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
 from typing import Optional
-import re
+import string
+from models import _check_phone_number
+
+# Byte set for bytes.translate(None, delete): one C-level pass over the
+# username, no regex engine involved
+_USERNAME_BYTES = (string.ascii_letters + string.digits + "_").encode()
 
 class UserUpdate(BaseModel):
     """Enhanced model for updating user information"""
@@ -30,36 +35,29 @@ class UserUpdate(BaseModel):
         description="Current password required for password updates"
     )
     
-    @field_validator('username')
+    @field_validator('username', mode='after')
+    @classmethod
     def validate_username(cls, v):
         if v is not None:
             # Username should only contain alphanumeric characters and underscores
-            if not re.match(r'^[a-zA-Z0-9_]+$', v):
+            # Deleting every allowed byte must leave nothing behind
+            if not v or not v.isascii() or v.encode().translate(None, _USERNAME_BYTES):
                 raise ValueError('Username can only contain letters, numbers, and underscores')
         return v
     
-    @field_validator('phone_number')
+    @field_validator('phone_number', mode='after')
+    @classmethod
     def validate_phone_number(cls, v):
-        if v is not None:
-            # Remove any non-digit characters for validation
-            digits_only = re.sub(r'\D', '', v)
-            if len(digits_only) < 10:
-                raise ValueError('Phone number must contain at least 10 digits')
-        return v
-    
-    @field_validator('password')
-    def validate_password(cls, v):
-        if v is not None:
-            # Add password strength requirements
-            if len(v) < 6:
-                raise ValueError('Password must be at least 6 characters long')
-            # Optional: Add more complex requirements
-            # if not re.search(r'[A-Za-z]', v) or not re.search(r'\d', v):
-            #     raise ValueError('Password must contain both letters and numbers')
-        return v
+        # Same format as registration, so updates can't store a number
+        # UserCreate would refuse (or dodge the unique index by formatting)
+        return _check_phone_number(v)
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        # Unknown fields are rejected during validation, before the handler runs
+        extra="forbid",
+        # Unset fields keep their None default without running validators
+        validate_default=False,
+        json_schema_extra={
             "example": {
                 "username": "john_doe_updated",
                 "email": "john.updated@example.com",
@@ -67,4 +65,5 @@ class UserUpdate(BaseModel):
                 "current_password": "oldpassword123",
                 "password": "newpassword123"
             }
-        }
\ No newline at end of file
+        }
+    )
\ No newline at end of file